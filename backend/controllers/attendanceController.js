@@ -4,6 +4,7 @@ import Employee from '../models/Employee.js';
 import User from '../models/User.js';
 import Notification from '../models/Notification.js';
 import mongoose from 'mongoose';
+import { cosineSimilarity } from '../services/faceRecognitionService.js';
 
 export const OFFICE_LOCATION = {
   latitude: 22.298873262930066,
@@ -589,10 +590,7 @@ export const checkInWithFace = async (req, res) => {
     const currentDescriptor = faceDescriptor;
 
             // Cosine similarity
-            const dotProduct = registeredDescriptor.reduce((sum, val, i) => sum + val * currentDescriptor[i], 0);
-            const mag1 = Math.sqrt(registeredDescriptor.reduce((sum, val) => sum + val * val, 0));
-            const mag2 = Math.sqrt(currentDescriptor.reduce((sum, val) => sum + val * val, 0));
-            const similarity = dotProduct / (mag1 * mag2);
+            const similarity = cosineSimilarity(registeredDescriptor, currentDescriptor);
 
             // Shared threshold for cosine similarity (higher = stricter).
             // Kept in sync with the FACE_SIMILARITY_THRESHOLD used by the
@@ -791,10 +789,7 @@ export const verifyFace = async (req, res) => {
     const currentDescriptor = faceDescriptor;
 
             // Cosine similarity
-            const dotProduct = registeredDescriptor.reduce((sum, val, i) => sum + val * currentDescriptor[i], 0);
-            const mag1 = Math.sqrt(registeredDescriptor.reduce((sum, val) => sum + val * val, 0));
-            const mag2 = Math.sqrt(currentDescriptor.reduce((sum, val) => sum + val * val, 0));
-            const similarity = dotProduct / (mag1 * mag2);
+            const similarity = cosineSimilarity(registeredDescriptor, currentDescriptor);
 
             // Shared threshold for cosine similarity (higher = stricter).
             // Kept in sync with the FACE_SIMILARITY_THRESHOLD used by the
@@ -3,6 +3,7 @@ import User from '../models/User.js';
 import FaceData from '../models/FaceData.js';
 import Employee from '../models/Employee.js';
 import { sendEmail } from '../utils/email.js';
+import { invalidateFaceCache } from '../utils/faceCache.js';
 import Department from '../models/Department.js';
 
 // Create new employee
@@ -417,6 +418,9 @@ export const updateEmployee = async (req, res) => {
       });
     }
 
+    // The raw body may rewrite faceDescriptor, faceEmbeddings or hasFaceRegistered
+    invalidateFaceCache(employee.user?._id || employee.user);
+
     // Update department employee counts
     if (req.body.workInfo?.department) {
       try {
@@ -638,6 +642,10 @@ export const updateEmployeeWithFace = async (req, res) => {
       }
     }
 
+    // employeeData may also carry faceEmbeddings, so always invalidate. This runs after the
+    // FaceData write so a concurrent verify cannot re-cache the old descriptor
+    invalidateFaceCache(employee.user?._id || employee.user);
+
     // Sync with User collection if needed
     if (employee.user) {
       const updateUserData = {};
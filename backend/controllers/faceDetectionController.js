@@ -9,35 +9,50 @@ import fs from 'fs/promises';
 import * as faceService from '../services/faceRecognitionService.js';
 import { getSocketIdForUser } from '../socket/chat.js';
 import { measurePerformance } from '../utils/performanceLogger.js';
+import { getCachedFaceData, setCachedFaceData, invalidateFaceCache } from '../utils/faceCache.js';
 
 // Initialize face models on startup
 faceService.initializeFaceModels().catch(err => {
   console.error('Failed to initialize face models:', err);
 });
 
-// Simple in-memory cache for face descriptors
-const faceDescriptorCache = new Map();
-const CACHE_TTL = 1000 * 60 * 30; // 30 minutes
-
-const getCachedFaceData = (userId) => {
-  const cached = faceDescriptorCache.get(userId.toString());
-  if (cached && Date.now() - cached.timestamp < CACHE_TTL) {
-    return cached.data;
+// face-api.js descriptors have 128 dimensions
+const FACE_DESCRIPTOR_LENGTH = 128;
+
+/**
+ * Load a user's stored face embeddings, from the cache when possible
+ * Falls back from the employee's multi-angle embeddings to the single
+ * descriptor and finally to the FaceData record
+ * @param {string} userId - User id of the employee
+ * @returns {Promise<Object>} { embeddings } or { status, message } when unavailable
+ */
+const loadStoredEmbeddings = async (userId) => {
+  const cached = getCachedFaceData(userId);
+  if (cached) {
+    return { embeddings: cached };
   }
-  return null;
-};
 
-const setCachedFaceData = (userId, data) => {
-  faceDescriptorCache.set(userId.toString(), {
-    data,
-    timestamp: Date.now()
-  });
-};
+  const employee = await Employee.findOne({ user: userId });
+  if (!employee) {
+    return { status: 404, message: 'Employee record not found' };
+  }
 
-const invalidateFaceCache = (userId) => {
-  if (userId) {
-    faceDescriptorCache.delete(userId.toString());
+  let embeddings;
+  if (employee.faceEmbeddings && employee.faceEmbeddings.average && employee.faceEmbeddings.average.length === FACE_DESCRIPTOR_LENGTH) {
+    const { average, front, left, right } = employee.faceEmbeddings;
+    embeddings = { average, front, left, right };
+  } else if (employee.faceDescriptor && employee.faceDescriptor.length === FACE_DESCRIPTOR_LENGTH) {
+    embeddings = { average: employee.faceDescriptor };
+  } else {
+    const faceData = await FaceData.findByEmployee(employee._id);
+    if (!faceData || !faceData.faceDescriptor || faceData.faceDescriptor.length !== FACE_DESCRIPTOR_LENGTH) {
+      return { status: 404, message: 'Face data not registered. Please register your face first.' };
+    }
+    embeddings = { average: faceData.faceDescriptor };
   }
+
+  setCachedFaceData(userId, embeddings);
+  return { embeddings };
 };
 
 const storage = multer.diskStorage({
@@ -76,17 +91,29 @@ const withConcurrencyLimit = async (res, fn) => {
   }
 };
 
+const uploadLimits = { fileSize: 10 * 1024 * 1024 };
+
+const imageFileFilter = (req, file, cb) => {
+  const allowedTypes = /jpeg|jpg|png/;
+  const mimetype = allowedTypes.test(file.mimetype);
+  const extname = allowedTypes.test(path.extname(file.originalname).toLowerCase());
+
+  if (mimetype && extname) return cb(null, true);
+  cb(new Error('Only JPEG, JPG and PNG images are allowed'));
+};
+
 export const upload = multer({
   storage,
-  limits: { fileSize: 10 * 1024 * 1024 },
-  fileFilter: (req, file, cb) => {
-    const allowedTypes = /jpeg|jpg|png/;
-    const mimetype = allowedTypes.test(file.mimetype);
-    const extname = allowedTypes.test(path.extname(file.originalname).toLowerCase());
-
-    if (mimetype && extname) return cb(null, true);
-    cb(new Error('Only JPEG, JPG and PNG images are allowed'));
-  }
+  limits: uploadLimits,
+  fileFilter: imageFileFilter
+});
+
+// Uploads that are only analyzed and never stored stay in memory,
+// avoiding a disk write, read-back and unlink per request
+export const memoryUpload = multer({
+  storage: multer.memoryStorage(),
+  limits: uploadLimits,
+  fileFilter: imageFileFilter
 });
 
 // Legacy functions removed - now using integrated face recognition service
@@ -121,13 +148,12 @@ export const analyzeFrame = async (req, res) => {
       return res.status(400).json({ success: false, message: 'Image is required' });
     }
 
-    const imageBuffer = await fs.readFile(req.file.path);
+    const imageBuffer = req.file.buffer;
 
     let result;
     try {
-      result = await faceService.detectSingleFace(imageBuffer);
+      result = await faceService.detectSingleFaceCached(imageBuffer);
     } catch (error) {
-      try { await fs.unlink(req.file.path); } catch (_) {}
       return res.status(500).json({
         success: false,
         message: 'Face analysis service error',
@@ -135,8 +161,6 @@ export const analyzeFrame = async (req, res) => {
       });
     }
 
-    try { await fs.unlink(req.file.path); } catch (_) {}
-
     if (!result.success) {
       return res.json({
         success: false,
@@ -162,9 +186,6 @@ export const analyzeFrame = async (req, res) => {
 
   } catch (error) {
     console.error('Analyze frame error:', error);
-    if (req.file && req.file.path) {
-      try { await fs.unlink(req.file.path); } catch (_) {}
-    }
     res.status(500).json({ success: false, message: 'Server error during frame analysis' });
   }
 };
@@ -186,7 +207,7 @@ export const analyzeFrameBase64 = async (req, res) => {
     console.log('Processing base64 image...');
     let result;
     try {
-      result = await faceService.processBase64Image(image);
+      result = await faceService.processBase64Image(image, { useCache: true });
       console.log('Face detection result:', result.success ? 'Success' : 'Failed');
     } catch (error) {
       console.error('Face service error:', error);
@@ -288,6 +309,7 @@ export const registerMultiAngleFace = async (req, res) => {
     employee.faceRegistrationMethod = 'multi-angle';
 
     await employee.save();
+    invalidateFaceCache(employee.user._id || employee.user);
 
     // Also update/create FaceData record
     const existingFaceData = await FaceData.findOne({ employee: employeeId });
@@ -321,6 +343,8 @@ export const registerMultiAngleFace = async (req, res) => {
       });
       await faceData.save();
     }
+    // Again after FaceData is written so a concurrent verify cannot re-cache the old descriptor
+    invalidateFaceCache(employee.user._id || employee.user);
 
     res.json({ 
       success: true, 
@@ -361,27 +385,11 @@ export const verifyVideoFace = async (req, res) => {
 
     const userLocation = location;
 
-    const employee = await Employee.findOne({ user: req.user.id });
-    if (!employee) {
-      return res.status(404).json({ success: false, message: 'Employee record not found' });
-    }
-
-    // Check for face registration - face-api.js uses 128 dimensions
-    let storedEmbeddings;
-    if (employee.faceEmbeddings && employee.faceEmbeddings.average && employee.faceEmbeddings.average.length === 128) {
-      storedEmbeddings = employee.faceEmbeddings;
-    } else if (employee.faceDescriptor && employee.faceDescriptor.length === 128) {
-      storedEmbeddings = { average: employee.faceDescriptor };
-    } else {
-      const faceData = await FaceData.findByEmployee(employee._id);
-      if (!faceData || !faceData.faceDescriptor || faceData.faceDescriptor.length !== 128) {
-        return res.status(404).json({
-          success: false,
-          message: 'Face data not registered. Please register your face first.'
-        });
-      }
-      storedEmbeddings = { average: faceData.faceDescriptor };
+    const stored = await loadStoredEmbeddings(req.user.id);
+    if (!stored.embeddings) {
+      return res.status(stored.status).json({ success: false, message: stored.message });
     }
+    const storedEmbeddings = stored.embeddings;
 
     // Setup real-time progress updates
     const io = req.app.get('io');
@@ -544,6 +552,7 @@ export const saveEmployeeFace = async (req, res) => {
     employee.faceRegistrationDate = new Date();
     employee.faceRegistrationMethod = 'single';
     await employee.save();
+    invalidateFaceCache(employee.user._id || employee.user);
 
     const existingFaceData = await FaceData.findOne({ employee: employeeId });
     if (existingFaceData) {
@@ -559,6 +568,7 @@ export const saveEmployeeFace = async (req, res) => {
       };
 
       await existingFaceData.save();
+      invalidateFaceCache(employee.user._id || employee.user);
       return res.json({ success: true, message: 'Face data updated successfully', data: existingFaceData });
     }
 
@@ -577,6 +587,7 @@ export const saveEmployeeFace = async (req, res) => {
     });
 
     await faceData.save();
+    invalidateFaceCache(employee.user._id || employee.user);
     res.status(201).json({ success: true, message: 'Face data saved successfully', data: faceData });
 
   } catch (error) {
@@ -651,7 +662,6 @@ export const verifyFaceAttendance = async (req, res) => {
       try {
         location = JSON.parse(location);
       } catch (e) {
-        try { await fs.unlink(req.file.path); } catch (_) {}
         return res.status(400).json({
           success: false,
           message: 'Invalid location data format'
@@ -661,7 +671,6 @@ export const verifyFaceAttendance = async (req, res) => {
 
     // Validate location data is provided
     if (!location || location.latitude === undefined || location.longitude === undefined) {
-      try { await fs.unlink(req.file.path); } catch (_) {}
       return res.status(400).json({
         success: false,
         message: 'Location data is required for attendance verification'
@@ -670,35 +679,14 @@ export const verifyFaceAttendance = async (req, res) => {
 
     const userLocation = location;
 
-    const employee = await Employee.findOne({ user: req.user.id });
-    if (!employee) {
-      try { await fs.unlink(req.file.path); } catch (_) {}
-      return res.status(404).json({ success: false, message: 'Employee record not found' });
-    }
-
-    console.log('Employee found:', employee.employeeId);
-
     // Get stored descriptor from employee or FaceData
-    let storedDescriptor;
-    if (employee.faceEmbeddings && employee.faceEmbeddings.average && employee.faceEmbeddings.average.length > 0) {
-      storedDescriptor = employee.faceEmbeddings.average;
-    } else if (employee.faceDescriptor && employee.faceDescriptor.length > 0) {
-      storedDescriptor = employee.faceDescriptor;
-    } else {
-      const faceData = await FaceData.findByEmployee(employee._id);
-      if (!faceData) {
-        try { await fs.unlink(req.file.path); } catch (_) {}
-        return res.status(404).json({ success: false, message: 'Face data not registered. Please register your face first.' });
-      }
-      storedDescriptor = faceData.faceDescriptor;
+    const stored = await loadStoredEmbeddings(req.user.id);
+    if (!stored.embeddings) {
+      return res.status(stored.status).json({ success: false, message: stored.message });
     }
+    const storedDescriptor = stored.embeddings.average;
 
-    if (!Array.isArray(storedDescriptor) || storedDescriptor.length === 0) {
-      try { await fs.unlink(req.file.path); } catch (_) {}
-      return res.status(500).json({ success: false, message: 'Stored face descriptor invalid' });
-    }
-
-    const imageBuffer = await fs.readFile(req.file.path);
+    const imageBuffer = req.file.buffer;
     console.log('Starting face detection...');
 
     let currentFaceResult;
@@ -710,7 +698,6 @@ export const verifyFaceAttendance = async (req, res) => {
       console.log('Face detection result:', currentFaceResult.success ? 'Success' : 'Failed');
     } catch (error) {
       console.error('Face detection error:', error);
-      try { await fs.unlink(req.file.path); } catch (_) {}
       return res.status(500).json({
         success: false,
         message: 'Face detection service error',
@@ -718,8 +705,6 @@ export const verifyFaceAttendance = async (req, res) => {
       });
     }
 
-    try { await fs.unlink(req.file.path); } catch (_) {}
-
     if (!currentFaceResult.success) {
       return res.status(400).json({
         success: false,
@@ -792,9 +777,6 @@ export const verifyFaceAttendance = async (req, res) => {
 
   } catch (error) {
     console.error('Face verification error:', error);
-    if (req.file && req.file.path) {
-      try { await fs.unlink(req.file.path); } catch (_) {}
-    }
     res.status(500).json({ success: false, message: 'Server error during face verification' });
   }
 };
@@ -831,6 +813,7 @@ export const deleteEmployeeFace = async (req, res) => {
       employee.faceRegistrationDate = null;
       employee.faceRegistrationMethod = null;
       await employee.save();
+      invalidateFaceCache(employee.user);
     }
 
     const faceData = await FaceData.findOne({ employee: employeeId });
@@ -841,6 +824,10 @@ export const deleteEmployeeFace = async (req, res) => {
         console.warn('Could not delete face image file:', fileError);
       }
       await faceData.deleteOne();
+      // Again after FaceData is removed so a concurrent verify cannot re-cache the old descriptor
+      if (employee) {
+        invalidateFaceCache(employee.user);
+      }
     }
 
     res.json({ success: true, message: 'Face data deleted successfully' });
@@ -883,13 +870,12 @@ export const detectFaces = async (req, res) => {
       return res.status(400).json({ success: false, message: 'Image is required' });
     }
 
-    const imageBuffer = await fs.readFile(req.file.path);
+    const imageBuffer = req.file.buffer;
 
     let faceResult;
     try {
       faceResult = await faceService.detectFaces(imageBuffer);
     } catch (error) {
-      try { await fs.unlink(req.file.path); } catch (_) {}
       return res.status(500).json({
         success: false,
         message: 'Face detection service error',
@@ -897,8 +883,6 @@ export const detectFaces = async (req, res) => {
       });
     }
 
-    try { await fs.unlink(req.file.path); } catch (_) {}
-
     res.json({
       success: true,
       faces: faceResult.map(face => ({
@@ -911,9 +895,6 @@ export const detectFaces = async (req, res) => {
 
   } catch (error) {
     console.error('Face detection error:', error);
-    if (req.file && req.file.path) {
-      try { await fs.unlink(req.file.path); } catch (_) {}
-    }
     res.status(500).json({ success: false, message: 'Server error during face detection' });
   }
 };
@@ -1014,6 +995,11 @@ export const registerContinuousVideo = async (req, res) => {
       await faceData.save();
     }
 
+    // Again after FaceData is written so a concurrent verify cannot re-cache the old descriptor
+    if (employee.user) {
+      invalidateFaceCache(employee.user._id || employee.user);
+    }
+
     res.json({
       success: true,
       message: 'Face registered successfully with continuous video capture',
@@ -1055,35 +1041,11 @@ export const verifyLiveVideo = async (req, res) => {
 
     const userLocation = location;
 
-    // Check cache first for face data
-    let storedEmbeddings = getCachedFaceData(req.user.id);
-    let employee;
-
-    if (!storedEmbeddings) {
-      employee = await Employee.findOne({ user: req.user.id });
-      if (!employee) {
-        return res.status(404).json({ success: false, message: 'Employee record not found' });
-      }
-
-      // face-api.js uses 128-dimensional descriptors, not 512
-      if (employee.faceEmbeddings && employee.faceEmbeddings.average && employee.faceEmbeddings.average.length > 0) {
-        storedEmbeddings = employee.faceEmbeddings;
-      } else if (employee.faceDescriptor && employee.faceDescriptor.length > 0) {
-        storedEmbeddings = { average: employee.faceDescriptor };
-      } else {
-        const faceData = await FaceData.findByEmployee(employee._id);
-        if (!faceData || !faceData.faceDescriptor || faceData.faceDescriptor.length === 0) {
-          return res.status(404).json({
-            success: false,
-            message: 'Face data not registered. Please register your face first.'
-          });
-        }
-        storedEmbeddings = { average: faceData.faceDescriptor };
-      }
-
-      // Cache the embeddings
-      setCachedFaceData(req.user.id, storedEmbeddings);
+    const stored = await loadStoredEmbeddings(req.user.id);
+    if (!stored.embeddings) {
+      return res.status(stored.status).json({ success: false, message: stored.message });
     }
+    const storedEmbeddings = stored.embeddings;
 
     // Setup real-time progress updates
     const io = req.app.get('io');
@@ -1221,8 +1183,7 @@ export const checkLiveness = async (req, res) => {
     }
 
     // Basic liveness score based on valid frames
-    const livenessScore = Math.min(1.0, result.validFrames / 10);
-    const livenessPassed = result.validFrames >= 2 && livenessScore > 0.3;
+    const { score: livenessScore, passed: livenessPassed } = faceService.scoreLiveness(result.validFrames);
 
     res.json({
       success: true,
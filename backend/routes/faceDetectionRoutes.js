@@ -13,7 +13,8 @@ import {
   verifyVideoFace,
   verifyLiveVideo,
   checkLiveness,
-  upload
+  upload,
+  memoryUpload
 } from '../controllers/faceDetectionController.js';
 import { protect, adminOnly } from '../middleware/authMiddleware.js';
 
@@ -28,7 +29,7 @@ router.post('/register-continuous-video', adminOnly, registerContinuousVideo);
 router.post('/register-multi-angle', adminOnly, registerMultiAngleFace);
 
 // Frame analysis for real-time feedback
-router.post('/analyze-frame', adminOnly, upload.single('file'), analyzeFrame);
+router.post('/analyze-frame', adminOnly, memoryUpload.single('file'), analyzeFrame);
 router.post('/analyze-frame-base64', adminOnly, analyzeFrameBase64);
 
 // Live video verification with enhanced liveness detection (new primary method)
@@ -48,10 +49,10 @@ router.get('/employee/:employeeId', getEmployeeFace);
 router.delete('/employee/:employeeId', adminOnly, deleteEmployeeFace);
 
 // Legacy single-image verification
-router.post('/verify-attendance', upload.single('file'), verifyFaceAttendance);
+router.post('/verify-attendance', memoryUpload.single('file'), verifyFaceAttendance);
 
 router.get('/employees-without-face', adminOnly, getEmployeesWithoutFace);
 
-router.post('/detect', upload.single('file'), detectFaces);
+router.post('/detect', memoryUpload.single('file'), detectFaces);
 
 export default router;
@@ -5,6 +5,7 @@ import canvas from 'canvas';
 import path from 'path';
 import { fileURLToPath } from 'url';
 import fs from 'fs/promises';
+import crypto from 'crypto';
 
 const __filename = fileURLToPath(import.meta.url);
 const __dirname = path.dirname(__filename);
@@ -20,6 +21,41 @@ let tfInitialized = false;
 const FACE_MATCH_THRESHOLD = parseFloat(process.env.FACE_MATCH_THRESHOLD) || 0.45;
 const FACE_MIN_CONFIDENCE = parseFloat(process.env.FACE_MIN_CONFIDENCE) || 0.7;
 const FACE_FRONTALITY_TOLERANCE = parseFloat(process.env.FACE_FRONTALITY_TOLERANCE) || 0.15;
+// Liveness scoring: score grows with valid frames up to LIVENESS_FULL_SCORE_FRAMES
+const LIVENESS_FULL_SCORE_FRAMES = 10;
+const LIVENESS_MIN_VALID_FRAMES = 2;
+const LIVENESS_MIN_SCORE = 0.3;
+const FACE_MAX_CONCURRENT_DETECTIONS = parseInt(process.env.FACE_MAX_CONCURRENT_DETECTIONS, 10) || 2;
+
+// Admission control: detections beyond the limit wait in FIFO order instead of
+// interleaving on the single TensorFlow.js CPU thread
+let activeDetections = 0;
+const detectionQueue = [];
+
+/**
+ * Run a face-api inference while holding one of the detection slots
+ * @param {Function} fn - Async function performing the inference
+ * @returns {Promise<*>} Result of fn
+ */
+async function withDetectionSlot(fn) {
+  if (activeDetections < FACE_MAX_CONCURRENT_DETECTIONS) {
+    activeDetections++;
+  } else {
+    // The releasing caller hands its slot over directly
+    await new Promise(resolve => detectionQueue.push(resolve));
+  }
+
+  try {
+    return await fn();
+  } finally {
+    const next = detectionQueue.shift();
+    if (next) {
+      next();
+    } else {
+      activeDetections--;
+    }
+  }
+}
 
 /**
  * Initialize TensorFlow.js backend
@@ -77,6 +113,31 @@ export async function initializeFaceModels() {
   }
 }
 
+/**
+ * Decode an image and scale it down to fit within maxWidth x maxHeight
+ * @param {Buffer} imageBuffer - Image buffer
+ * @param {number} maxWidth - Maximum width in pixels
+ * @param {number} maxHeight - Maximum height in pixels (unbounded by default)
+ * @returns {Promise<Image|Canvas>} Image ready for face-api
+ */
+async function loadImageForDetection(imageBuffer, maxWidth, maxHeight = Infinity) {
+  const img = await canvas.loadImage(imageBuffer);
+  const widthScale = maxWidth / img.width;
+  const heightScale = maxHeight / img.height;
+  if (widthScale >= 1 && heightScale >= 1) {
+    return img;
+  }
+
+  // Keep the bounding side exact and the other fractional; the canvas truncates it,
+  // which matches the sizing stored templates were computed at
+  const newWidth = widthScale <= heightScale ? maxWidth : img.width * heightScale;
+  const newHeight = widthScale <= heightScale ? img.height * widthScale : maxHeight;
+  const cvs = new Canvas(Math.floor(newWidth), Math.floor(newHeight));
+  const ctx = cvs.getContext('2d');
+  ctx.drawImage(img, 0, 0, newWidth, newHeight);
+  return cvs;
+}
+
 /**
  * Detect faces in an image buffer
  * @param {Buffer} imageBuffer - Image buffer
@@ -89,24 +150,13 @@ export async function detectFaces(imageBuffer) {
 
   const startTime = Date.now();
   try {
-    const img = await canvas.loadImage(imageBuffer);
+    // Resize so the longest side is at most 640px for speed
+    const processImg = await loadImageForDetection(imageBuffer, 640, 640);
     
-    // Resize large images for performance
-    let processImg = img;
-    const MAX_WIDTH = 640; // Resize to max 640px width for speed
-    if (img.width > MAX_WIDTH) {
-      const scaleFactor = MAX_WIDTH / img.width;
-      const newHeight = img.height * scaleFactor;
-      const cvs = new Canvas(MAX_WIDTH, newHeight);
-      const ctx = cvs.getContext('2d');
-      ctx.drawImage(img, 0, 0, MAX_WIDTH, newHeight);
-      processImg = cvs;
-    }
-    
-    const detections = await faceapi
+    const detections = await withDetectionSlot(() => faceapi
       .detectAllFaces(processImg)
       .withFaceLandmarks()
-      .withFaceDescriptors();
+      .withFaceDescriptors());
 
     console.log(`Face detection took ${Date.now() - startTime}ms`);
 
@@ -125,6 +175,7 @@ export async function detectFaces(imageBuffer) {
 /**
  * Detect a single face and return its descriptor with enhanced accuracy
  * @param {Buffer} imageBuffer - Image buffer
+ * @param {Object} options - Detection options (rawDescriptor keeps the Float32Array from face-api)
  * @returns {Promise<Object>} Face detection result
  */
 export async function detectSingleFace(imageBuffer, options = {}) {
@@ -133,28 +184,18 @@ export async function detectSingleFace(imageBuffer, options = {}) {
   }
 
   const startTime = Date.now();
-  const { skipFrontalityCheck = false, skipQualityCheck = false } = options;
+  const { skipFrontalityCheck = false, skipQualityCheck = false, rawDescriptor = false } = options;
 
   try {
-    const img = await canvas.loadImage(imageBuffer);
-
-    // Resize large images for performance
-    let processImg = img;
-    const MAX_WIDTH = 320; // Reduced to 320px for faster processing
-    if (img.width > MAX_WIDTH) {
-      const scaleFactor = MAX_WIDTH / img.width;
-      const newHeight = img.height * scaleFactor;
-      const cvs = new Canvas(MAX_WIDTH, newHeight);
-      const ctx = cvs.getContext('2d');
-      ctx.drawImage(img, 0, 0, MAX_WIDTH, newHeight);
-      processImg = cvs;
-    }
+    // Reduced to 320px width for faster processing. Only the width is capped:
+    // stored templates were computed at this scale, so portrait frames keep their height
+    const processImg = await loadImageForDetection(imageBuffer, 320);
 
     // Use higher quality detection with minimum confidence threshold
-    const detection = await faceapi
+    const detection = await withDetectionSlot(() => faceapi
       .detectSingleFace(processImg, new faceapi.SsdMobilenetv1Options({ minConfidence: 0.5 }))
       .withFaceLandmarks()
-      .withFaceDescriptor();
+      .withFaceDescriptor());
 
     console.log(`Single face detection took ${Date.now() - startTime}ms`);
 
@@ -193,7 +234,7 @@ export async function detectSingleFace(imageBuffer, options = {}) {
         bbox: detection.detection.box,
         confidence: detection.detection.score,
         landmarks: detection.landmarks.positions,
-        descriptor: Array.from(detection.descriptor),
+        descriptor: rawDescriptor ? detection.descriptor : Array.from(detection.descriptor),
         quality: detection.detection.score
       }
     };
@@ -203,6 +244,39 @@ export async function detectSingleFace(imageBuffer, options = {}) {
   }
 }
 
+// Recent single-face results keyed by image content. Live preview clients
+// resend byte-identical frames while the user holds still.
+const ANALYSIS_CACHE_SIZE = 64;
+const analysisCache = new Map();
+
+/**
+ * Detect a single face, reusing the result for recently analyzed identical images
+ * @param {Buffer} imageBuffer - Image buffer
+ * @param {Object} options - Detection options
+ * @returns {Promise<Object>} Face detection result
+ */
+export async function detectSingleFaceCached(imageBuffer, options = {}) {
+  const key = crypto.createHash('sha1')
+    .update(imageBuffer)
+    .update(JSON.stringify(options))
+    .digest('base64');
+
+  const cached = analysisCache.get(key);
+  if (cached) {
+    // Re-insert to mark as most recently used
+    analysisCache.delete(key);
+    analysisCache.set(key, cached);
+    return cached;
+  }
+
+  const result = await detectSingleFace(imageBuffer, options);
+  analysisCache.set(key, result);
+  if (analysisCache.size > ANALYSIS_CACHE_SIZE) {
+    analysisCache.delete(analysisCache.keys().next().value);
+  }
+  return result;
+}
+
 /**
  * Check if face is frontal by analyzing facial landmarks
  * @param {Object} landmarks - Face landmarks
@@ -339,6 +413,7 @@ export async function processVideoFrames(base64Frames, onProgress) {
 
   const validDescriptors = [];
   const frameResults = [];
+  const seenFrames = new Set();
   
   // Early exit if we have enough good frames
   const REQUIRED_GOOD_FRAMES = 2;
@@ -351,6 +426,14 @@ export async function processVideoFrames(base64Frames, onProgress) {
     const frame = base64Frames[i];
     if (validDescriptors.length >= REQUIRED_GOOD_FRAMES) break;
 
+    // Byte-identical frames add no information; skip decode and inference for repeats.
+    // Malformed entries fall through to the per-frame try below and are skipped there
+    if (typeof frame === 'string') {
+      const frameHash = crypto.createHash('sha1').update(frame).digest('base64');
+      if (seenFrames.has(frameHash)) continue;
+      seenFrames.add(frameHash);
+    }
+
     if (onProgress) {
       onProgress({
         status: 'processing_frame',
@@ -362,11 +445,10 @@ export async function processVideoFrames(base64Frames, onProgress) {
     }
 
     try {
-      // Remove data URL prefix if present
-      const base64Data = frame.replace(/^data:image\/\w+;base64,/, '');
-      const imageBuffer = Buffer.from(base64Data, 'base64');
+      const imageBuffer = decodeBase64Image(frame);
       
-      const result = await detectSingleFace(imageBuffer);
+      // Descriptors stay Float32Arrays until they are averaged
+      const result = await detectSingleFace(imageBuffer, { rawDescriptor: true });
       
       if (result.success) {
         validDescriptors.push(result.face.descriptor);
@@ -417,27 +499,25 @@ export async function processVideoFrames(base64Frames, onProgress) {
 
 /**
  * Calculate average descriptor from multiple descriptors
- * @param {Array<Array<number>>} descriptors - Array of face descriptors
+ * @param {Array<ArrayLike<number>>} descriptors - Array of face descriptors
  * @returns {Array<number>} Average descriptor
  */
 function calculateAverageDescriptor(descriptors) {
   if (descriptors.length === 0) return null;
-  if (descriptors.length === 1) return descriptors[0];
+  if (descriptors.length === 1) return Array.from(descriptors[0]);
 
   const descriptorLength = descriptors[0].length;
-  const average = new Array(descriptorLength).fill(0);
+  // Accumulate in one contiguous typed buffer, then divide while copying out
+  const sum = new Float64Array(descriptorLength);
 
   for (const descriptor of descriptors) {
     for (let i = 0; i < descriptorLength; i++) {
-      average[i] += descriptor[i];
+      sum[i] += descriptor[i];
     }
   }
 
-  for (let i = 0; i < descriptorLength; i++) {
-    average[i] /= descriptors.length;
-  }
-
-  return average;
+  const count = descriptors.length;
+  return Array.from(sum, value => value / count);
 }
 
 /**
@@ -455,8 +535,38 @@ export function compareFaceDescriptors(descriptor1, descriptor2) {
     throw new Error('Descriptors must have the same length');
   }
 
-  const distance = faceapi.euclideanDistance(descriptor1, descriptor2);
-  return distance;
+  // Direct loop instead of faceapi.euclideanDistance, which maps into a temporary array
+  let squared = 0;
+  for (let i = 0; i < descriptor1.length; i++) {
+    const diff = descriptor1[i] - descriptor2[i];
+    squared += diff * diff;
+  }
+
+  return Math.sqrt(squared);
+}
+
+/**
+ * Cosine similarity between two face descriptors
+ * Dot product and both magnitudes are accumulated in a single pass
+ * @param {ArrayLike<number>} descriptor1 - First face descriptor
+ * @param {ArrayLike<number>} descriptor2 - Second face descriptor
+ * @returns {number} Cosine similarity (-1 to 1, higher is more similar)
+ */
+export function cosineSimilarity(descriptor1, descriptor2) {
+  let dot = 0;
+  let norm1 = 0;
+  let norm2 = 0;
+
+  for (let i = 0; i < descriptor1.length; i++) {
+    const a = descriptor1[i];
+    const b = descriptor2[i];
+    dot += a * b;
+    norm1 += a * a;
+    norm2 += b * b;
+  }
+
+  const denominator = Math.sqrt(norm1 * norm2);
+  return denominator > 0 ? dot / denominator : 0;
 }
 
 /**
@@ -483,20 +593,34 @@ export function verifyFaceMatch(descriptor1, descriptor2, threshold = FACE_MATCH
   };
 }
 
+/**
+ * Decode a base64 image, with or without a data URL prefix, into a buffer
+ * The prefix is located by searching only the header region, so the
+ * (often multi-MB) payload is never scanned or copied by a regex
+ * @param {string} base64Image - Base64 encoded image
+ * @returns {Buffer} Decoded image bytes
+ */
+function decodeBase64Image(base64Image) {
+  // Base64 never contains ',' so a comma near the start ends a data URL header
+  const commaIndex = base64Image.lastIndexOf(',', 64);
+  return Buffer.from(commaIndex === -1 ? base64Image : base64Image.slice(commaIndex + 1), 'base64');
+}
+
 /**
  * Process base64 image and detect face
  * @param {string} base64Image - Base64 encoded image
- * @param {Object} options - Detection options
+ * @param {Object} options - Detection options (useCache reuses results for identical images)
  * @returns {Promise<Object>} Detection result
  */
 export async function processBase64Image(base64Image, options = {}) {
-  const base64Data = base64Image.replace(/^data:image\/\w+;base64,/, '');
-  const imageBuffer = Buffer.from(base64Data, 'base64');
+  const { useCache = false, ...detectOptions } = options;
+  const imageBuffer = decodeBase64Image(base64Image);
+  const detect = useCache ? detectSingleFaceCached : detectSingleFace;
   // For admin registration, skip strict frontality and quality checks
-  return await detectSingleFace(imageBuffer, {
+  return await detect(imageBuffer, {
     skipFrontalityCheck: true,
     skipQualityCheck: true,
-    ...options
+    ...detectOptions
   });
 }
 
@@ -540,6 +664,19 @@ export async function registerMultiAngleFace(frontImage, _leftImage, _rightImage
   };
 }
 
+/**
+ * Score liveness from the number of frames with a valid face
+ * @param {number} validFrames - Frames in which a face was detected
+ * @returns {Object} Liveness score (0-1) and pass/fail flag
+ */
+export function scoreLiveness(validFrames) {
+  const score = Math.min(1.0, validFrames / LIVENESS_FULL_SCORE_FRAMES);
+  return {
+    score,
+    passed: validFrames >= LIVENESS_MIN_VALID_FRAMES && score > LIVENESS_MIN_SCORE
+  };
+}
+
 /**
  * Verify face from video frames against stored embeddings
  * @param {Array<string>} frames - Array of base64 frames
@@ -576,8 +713,7 @@ export async function verifyVideoFace(frames, storedEmbeddings, onProgress) {
   const verification = verifyFaceMatch(videoResult.averageDescriptor, storedDescriptor);
 
   // Basic liveness check: require multiple valid frames
-  const livenessScore = Math.min(1.0, videoResult.validFrames / 10);
-  const livenessPassed = videoResult.validFrames >= 2 && livenessScore > 0.3;
+  const { score: livenessScore, passed: livenessPassed } = scoreLiveness(videoResult.validFrames);
 
   if (onProgress) {
     onProgress({
@@ -0,0 +1,26 @@
+// utils/faceCache.js
+
+// Simple in-memory cache for stored face embeddings, keyed by user id
+const faceDescriptorCache = new Map();
+const CACHE_TTL = 1000 * 60 * 30; // 30 minutes
+
+export const getCachedFaceData = (userId) => {
+  const cached = faceDescriptorCache.get(userId.toString());
+  if (cached && Date.now() - cached.timestamp < CACHE_TTL) {
+    return cached.data;
+  }
+  return null;
+};
+
+export const setCachedFaceData = (userId, data) => {
+  faceDescriptorCache.set(userId.toString(), {
+    data,
+    timestamp: Date.now()
+  });
+};
+
+export const invalidateFaceCache = (userId) => {
+  if (userId) {
+    faceDescriptorCache.delete(userId.toString());
+  }
+};